@@ -1,19 +1,30 @@
+import os
+
 from enum import IntEnum
 from typing import NamedTuple
 
+_LINESEP = os.linesep
+
 # board array dimensions and bitboard size
+# _PAD is the number of always-zero border bits between rows; it must be at least 2 so a knight stepping two columns sideways can never wrap onto the next row
+# (the default 11x9 board needs 115 bits; boards with (_WIDTH + _PAD) * _HEIGHT - _PAD <= 64, e.g. 7x7, fit in a single machine word)
 _WIDTH = 11
 _HEIGHT = 9
-_SIZE = (_WIDTH + 2) * _HEIGHT - 2
+_PAD = 2
+assert _PAD >= 2, "knight moves wrap across rows with less than two padding bits"
+_SIZE = (_WIDTH + _PAD) * _HEIGHT - _PAD
+
+# single-bit mask of each cell
+_BIT = tuple(1 << i for i in range(_SIZE))
 
 # Build the prototype bitboard, which is a bitstring
 _BLANK_BOARD = 0
 row = ((1 << _WIDTH) - 1)
 for _ in range(_HEIGHT):
-    _BLANK_BOARD = (_BLANK_BOARD << (_WIDTH + 2)) | row
+    _BLANK_BOARD = (_BLANK_BOARD << (_WIDTH + _PAD)) | row
 
 # declare constants describing the bit-wise offsets for each cardinal direction
-S, N, W, E = -_WIDTH - 2, _WIDTH + 2, 1, -1
+S, N, W, E = -_WIDTH - _PAD, _WIDTH + _PAD, 1, -1
 
 
 class Action(IntEnum):
@@ -28,7 +39,23 @@ class Action(IntEnum):
     NNW = N + N + W
 
 
-_ACTIONSET = set(Action)
+# plain int offsets of the actions; loops and membership tests on these skip the IntEnum machinery
+_ACTION_DELTAS = tuple(int(a) for a in Action)
+_ACTIONSET = set(_ACTION_DELTAS)
+_ACTION_BY_DELTA = dict(zip(_ACTION_DELTAS, Action))
+
+# knight-move destinations of each cell, in Action order
+KNIGHT_CELLS = [tuple(loc + a for a in _ACTION_DELTAS if 0 <= loc + a < _SIZE) for loc in range(_SIZE)]
+
+# knight-move destinations of each cell as a bitmask
+KNIGHT_MASK = [0] * _SIZE
+for loc in range(_SIZE):
+    for c in KNIGHT_CELLS[loc]:
+        KNIGHT_MASK[loc] |= _BIT[c]
+
+# KNIGHT_MASK[-1] is for an unplaced player (loc == -1)
+OPENING_MASK = _BLANK_BOARD
+KNIGHT_MASK.append(OPENING_MASK)
 
 nt = NamedTuple('Isolation', [('board', int),
                          ('ply_count', int),
@@ -48,9 +75,9 @@ class Isolation(nt):
         Cumulative count of the number of actions applied to the board
 
         locs: tuple
-        A pair of values defining the location of each player. Default for each player is None while the player has not yet placed their piece on the board; otherwise an integer.
+        A pair of values defining the location of each player. Default for each player is -1 while the player has not yet placed their piece on the board; otherwise an integer.
         """
-    def __new__(cls, board=_BLANK_BOARD, ply_count=0, locs=(None, None)):
+    def __new__(cls, board=_BLANK_BOARD, ply_count=0, locs=(-1, -1)):
         return super(Isolation, cls).__new__(cls, board, ply_count, locs)
 
     def actions(self):
@@ -62,9 +89,9 @@ class Isolation(nt):
         A list containing the endpoints of all legal moves for the active player on the board
         """
         loc = self.locs[self.player()]
-        if loc is None:
+        if loc < 0:
             return self.liberties(loc)
-        return [a for a in Action if (a + loc) >= 0 and (self.board & (1 << (a + loc)))]
+        return [_ACTION_BY_DELTA[c - loc] for c in self.liberties(loc)]
 
     def player(self):
         """
@@ -82,14 +109,14 @@ class Isolation(nt):
             A new state object with the input move applied.
         """
         player_location = self.locs[self.player()]
-        assert player_location is None or action in _ACTIONSET, f"{action} is not a valid action from set {list(Action)}"
-        if player_location is None:
+        assert player_location < 0 or action in _ACTIONSET, f"{action} is not a valid action from set {list(Action)}"
+        if player_location < 0:
             player_location = 0
         player_location = int(action) + player_location
-        if not (self.board & (1 << player_location)):
+        if not (0 <= player_location < _SIZE and self.board & _BIT[player_location]):
             raise RuntimeError("Invalid move: target cell blocked")
         # update the board to block the ending cell from the new move
-        board = self.board ^ (1 << player_location)
+        board = self.board ^ _BIT[player_location]
         locs = (self.locs[0], player_location) if self.player() else (player_location, self.locs[1])
         return Isolation(board=board, ply_count=self.ply_count + 1, locs=locs)
 
@@ -126,14 +153,25 @@ class Isolation(nt):
         :param loc: int - A position on the current board to use as the anchor point for available liberties (i.e., open cells neighboring the anchor point)
         :return: list - a list containing the position of open liberties in the neighborhood of the starting position.
         """
-        cells = range(_SIZE) if loc is None else (loc + a for a in Action)
-        return [c for c in cells if c >= 0 and self.board & (1 << c)]
+        open_cells = self.board & KNIGHT_MASK[loc]
+        if not open_cells:
+            return []
+        if loc >= 0:
+            # KNIGHT_CELLS keeps the engine's Action order
+            return [c for c in KNIGHT_CELLS[loc] if open_cells & _BIT[c]]
+        cells = []
+        # walk the set bits from the lowest up, peeling off one bit per step
+        while open_cells:
+            lowest_bit = open_cells & -open_cells
+            cells.append(lowest_bit.bit_length() - 1)
+            open_cells ^= lowest_bit
+        return cells
 
     def _has_liberties(self, player_id):
         """
         Return True if the player has any legal moves in the given state.
         """
-        return any(self.liberties(self.locs[player_id]))
+        return (self.board & KNIGHT_MASK[self.locs[player_id]]) != 0
 
 
 class DebugState(Isolation):
@@ -186,36 +224,33 @@ class DebugState(Isolation):
         :param ind:
         :return: a tuple
         """
-        return ind % (_WIDTH + 2), ind // (_WIDTH + 2)
+        return ind % (_WIDTH + _PAD), ind // (_WIDTH + _PAD)
 
     def __str__(self):
         """
         Generates a string representation of the current game state, marking the location of each player and indicating which cells have been blocked, and which remain open
         :return: str - the string representation
         """
-        import os
-        from io import StringIO
         OPEN = " "
         CLOSED = "X"
         cell = "| {} "
         rowsep = "+ - " * _WIDTH + "+"
-        out = StringIO()
-        out.write(rowsep + os.linesep)
-
-        board = self.board << 2
-        for loc in range(_SIZE + 2):
-            if loc > 2 and loc % (_WIDTH + 2) == 0:
-                out.write("|" + os.linesep + rowsep + os.linesep)
-            if loc % (_WIDTH + 2) == 0 or loc % (_WIDTH + 2) == 1:
-                continue
-            sym = OPEN if (board & (1 << loc)) else CLOSED
-            if loc - 2 == self.locs[0]:
-                sym = self.player_symbols[0]
-            if loc - 2 == self.locs[1]:
-                sym = self.player_symbols[1]
-            out.write(cell.format(sym))
-        out.write("|" + os.linesep + rowsep + os.linesep)
-        return '\n'.join(l[::-1] for l in out.getvalue().split('\n')[::-1]) + os.linesep
+        lines = ["", rowsep]
+
+        # index 0 is the bottom right corner, so walk rows top-down and columns left-to-right by counting down
+        for y in reversed(range(_HEIGHT)):
+            row = []
+            for x in reversed(range(_WIDTH)):
+                loc = y * (_WIDTH + _PAD) + x
+                sym = OPEN if (self.board & _BIT[loc]) else CLOSED
+                if loc == self.locs[0]:
+                    sym = self.player_symbols[0]
+                if loc == self.locs[1]:
+                    sym = self.player_symbols[1]
+                row.append(cell.format(sym))
+            lines.append("".join(row) + "|")
+            lines.append(rowsep)
+        return _LINESEP.join(lines) + _LINESEP
 
 
 # test code
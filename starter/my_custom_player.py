@@ -1,7 +1,239 @@
+import random
 
+from collections import Counter, namedtuple
+
+from isolation.isolation import _BLANK_BOARD, _SIZE, _WIDTH, Action, N
 from sample_players import DataPlayer
 
 
+# half-width of the aspiration window around the previous iteration's value
+ASPIRATION_WINDOW = 2
+
+# transposition table bound flags; TERMINAL marks a finished game, whose value
+# is exact no matter how much search depth remains
+EXACT, LOWER, UPPER, TERMINAL = 0, 1, 2, 3
+
+TTEntry = namedtuple("TTEntry", "key depth value flag best_move")
+
+try:
+    popcount = int.bit_count
+except AttributeError:  # int.bit_count() was added in Python 3.10
+    def popcount(bits): return bin(bits).count("1")
+
+# single-bit mask of every cell, so bit tests index a table instead of
+# building a new long integer with a shift
+_BIT = tuple(1 << cell for cell in range(_SIZE))
+
+# knight-move neighborhood of every cell: KNIGHT_MASK[loc] has a bit set for
+# every cell of the board one knight move away from loc. A player that has
+# not been placed yet (loc == -1) may move to any open cell, so the last
+# entry, KNIGHT_MASK[-1], is the whole board.
+KNIGHT_MASK = []
+for loc in range(_SIZE):
+    neighbors = 0
+    for action in Action:
+        if 0 <= loc + action < _SIZE:
+            neighbors |= _BIT[loc + action]
+    KNIGHT_MASK.append(neighbors & _BLANK_BOARD)
+KNIGHT_MASK.append(_BLANK_BOARD)
+
+# Zobrist keys: one random 64-bit int per (cell, content) pair, where content
+# is 0 = blocked, 1 = player 1 stands here, 2 = player 2 stands here. The number
+# of blocked cells equals the ply count, so the side to move is implied.
+_rng = random.Random(0x15014710)
+_ZOBRIST = [_rng.getrandbits(64) for _ in range(_SIZE * 3)]
+
+# left-right reflection of every cell (column x of a row <-> column _WIDTH - 1 - x);
+# rows are N bits apart, and the padding bits between them are never
+# occupied and map to themselves
+MIRROR = [cell - cell % N + _WIDTH - 1 - cell % N
+          if cell % N < _WIDTH else cell for cell in range(_SIZE)]
+
+# Zobrist keys of the mirror image: hashing a state with these gives the same
+# key as hashing its reflection with _ZOBRIST
+_ZOBRIST_MIRROR = [_ZOBRIST[3 * MIRROR[i // 3] + i % 3] for i in range(_SIZE * 3)]
+
+
+def zobrist_hash(state, keys=_ZOBRIST):
+    """ Compute the Zobrist key of an isolation state from scratch """
+    state_hash = 0
+    blocked = _BLANK_BOARD & ~state.board
+    for cell in range(_SIZE):
+        if blocked & _BIT[cell]:
+            state_hash ^= keys[3 * cell]
+    for player_id, loc in enumerate(state.locs):
+        # unplaced players are None in isolation.Isolation, -1 in _FastState
+        if loc is not None and loc >= 0:
+            state_hash ^= keys[3 * loc + 1 + player_id]
+    return state_hash
+
+
+def horizon_search(board, own_loc, opp_loc, alpha, beta, knight_mask=KNIGHT_MASK):
+    """ Negamax search of a node one ply above the search horizon
+
+    This is the innermost kernel of the search, so it works on raw ints (the
+    bitboard and both knight locations) instead of a state object: each
+    child is scored straight from `board ^ move_bit` with two popcounts, and
+    no state update, frame or method call is needed per leaf.
+
+    Returns
+    -------
+    (value, move)
+        The value for the player to move and the best destination cell
+    """
+    best_value, best_move = None, None
+    opp_mask = knight_mask[opp_loc]
+    moves = board & knight_mask[own_loc]
+    while moves:
+        move_bit = moves & -moves
+        moves ^= move_bit
+        cell = move_bit.bit_length() - 1
+        child_board = board ^ move_bit
+        opp_open = child_board & opp_mask
+        own_open = child_board & knight_mask[cell]
+        # a lone liberty at cell 0 (the bit value 1) counts as none, like in liberty_counts()
+        opp_free = 0 if opp_open == 1 else popcount(opp_open)
+        own_free = 0 if own_open == 1 else popcount(own_open)
+        # the opponent moves next, so the game ends in our favor if they're
+        # stuck, and in theirs if only we are stuck
+        if not opp_free:
+            value = float("inf")
+        elif not own_free:
+            value = float("-inf")
+        else:
+            value = own_free - opp_free
+        if best_value is None or value > best_value:
+            best_value, best_move = value, cell
+            if value > alpha:
+                alpha = value
+                if alpha >= beta:
+                    break
+    return best_value, best_move
+
+
+class _FastState:
+    """ Mutable stand-in for isolation.Isolation used inside the search tree
+
+    Moves are applied in place with do_move() and reverted with undo_move(),
+    so descending the tree allocates no new state objects. Actions are the
+    destination cells of the active player rather than Action offsets; use
+    to_action() to convert back at the get_action() boundary. The Zobrist
+    key of the state is kept up to date in `key`. Unplaced players are at -1
+    rather than None, so KNIGHT_MASK[loc] covers the opening move as well.
+
+    If the starting state is its own mirror image, every position in its
+    tree has its mirror image in the same tree, so the key of the mirror
+    image is kept in `mirror_key` as well. Otherwise mirror images almost
+    never meet, and `mirror_key` is None to skip the extra bookkeeping.
+    """
+    __slots__ = ('board', 'ply_count', 'locs', 'key', 'mirror_key', '_history')
+
+    def __init__(self, state):
+        self.board = state.board
+        self.ply_count = state.ply_count
+        self.locs = [-1 if loc is None else loc for loc in state.locs]
+        self.key = zobrist_hash(state)
+        mirror_key = zobrist_hash(state, _ZOBRIST_MIRROR)
+        self.mirror_key = mirror_key if mirror_key == self.key else None
+        self._history = []
+
+    def actions(self):
+        """ Return the destination cells of all legal moves for the active player """
+        loc = self.locs[self.ply_count % 2]
+        open_cells = self.board & KNIGHT_MASK[loc]
+        cells = []
+        while open_cells:
+            lowest_bit = open_cells & -open_cells
+            cells.append(lowest_bit.bit_length() - 1)
+            open_cells ^= lowest_bit
+        return cells
+
+    def to_action(self, cell):
+        """ Convert a destination cell into the action Isolation.result() expects """
+        loc = self.locs[self.ply_count % 2]
+        return cell if loc < 0 else Action(cell - loc)
+
+    def do_move(self, cell):
+        """ Move the active player to `cell`, remembering where it came from """
+        player_id = self.ply_count % 2
+        prev_loc = self.locs[player_id]
+        self._history.append(prev_loc)
+        self.locs[player_id] = cell
+        self.board ^= _BIT[cell]
+        self.key ^= _ZOBRIST[3 * cell] ^ _ZOBRIST[3 * cell + 1 + player_id]
+        if prev_loc >= 0:
+            self.key ^= _ZOBRIST[3 * prev_loc + 1 + player_id]
+        if self.mirror_key is not None:
+            self.mirror_key ^= _ZOBRIST_MIRROR[3 * cell] ^ _ZOBRIST_MIRROR[3 * cell + 1 + player_id]
+            if prev_loc >= 0:
+                self.mirror_key ^= _ZOBRIST_MIRROR[3 * prev_loc + 1 + player_id]
+        self.ply_count += 1
+
+    def undo_move(self):
+        """ Revert the most recent do_move(); every update above is an XOR,
+        so applying it a second time restores the previous state
+        """
+        self.ply_count -= 1
+        player_id = self.ply_count % 2
+        prev_loc = self._history.pop()
+        cell = self.locs[player_id]
+        self.locs[player_id] = prev_loc
+        self.board ^= _BIT[cell]
+        self.key ^= _ZOBRIST[3 * cell] ^ _ZOBRIST[3 * cell + 1 + player_id]
+        if prev_loc >= 0:
+            self.key ^= _ZOBRIST[3 * prev_loc + 1 + player_id]
+        if self.mirror_key is not None:
+            self.mirror_key ^= _ZOBRIST_MIRROR[3 * cell] ^ _ZOBRIST_MIRROR[3 * cell + 1 + player_id]
+            if prev_loc >= 0:
+                self.mirror_key ^= _ZOBRIST_MIRROR[3 * prev_loc + 1 + player_id]
+
+    def liberty_counts(self):
+        """ Return the number of legal moves of the active player and of its
+        opponent; the game is over as soon as either one is zero
+
+        The counts follow the referee: Isolation.terminal_test() checks
+        any(liberties), which is False when the only open liberty is cell 0,
+        so that case counts as zero. Every other count is the exact number
+        of moves, which is what the mobility score needs once the game is
+        known to be live.
+        """
+        player_id = self.ply_count % 2
+        board = self.board
+        own_open = board & KNIGHT_MASK[self.locs[player_id]]
+        opp_open = board & KNIGHT_MASK[self.locs[1 - player_id]]
+        return (0 if own_open == _BIT[0] else popcount(own_open),
+                0 if opp_open == _BIT[0] else popcount(opp_open))
+
+
+class TranspositionTable:
+    """ Fixed-size transposition table using a two-bucket replacement scheme
+
+    Every slot has a depth-preferred bucket, which only gets overwritten by a
+    search at least as deep, and an always-replace bucket that catches
+    everything else. Memory use is capped at 2 * 2**size_bits entries.
+    """
+    def __init__(self, size_bits=16):
+        self.mask = (1 << size_bits) - 1
+        self.deep = [None] * (self.mask + 1)
+        self.recent = [None] * (self.mask + 1)
+
+    def get(self, key):
+        index = key & self.mask
+        entry = self.deep[index]
+        if entry is not None and entry.key == key: return entry
+        entry = self.recent[index]
+        if entry is not None and entry.key == key: return entry
+        return None
+
+    def put(self, entry):
+        index = entry.key & self.mask
+        deep = self.deep[index]
+        if deep is None or deep.key == entry.key or entry.depth >= deep.depth:
+            self.deep[index] = entry
+        else:
+            self.recent[index] = entry
+
+
 class CustomPlayer(DataPlayer):
     """ Implement your own agent to play knight's Isolation
 
@@ -19,6 +251,14 @@ class CustomPlayer(DataPlayer):
       any pickleable object to the self.context attribute.
     **********************************************************************
     """
+    def __init__(self, player_id):
+        super().__init__(player_id)
+        self.tt = TranspositionTable()
+        # moves that recently caused a beta cutoff: two per ply count, plus a
+        # running score per destination cell weighted by the depth searched
+        self.killers = [[None, None] for _ in range(_SIZE + 1)]
+        self.history = Counter()
+
     def get_action(self, state):
         """ Employ an adversarial search technique to choose an action
         available in the current state calls self.queue.put(ACTION) at least
@@ -42,83 +282,271 @@ class CustomPlayer(DataPlayer):
         # EXAMPLE: choose a random move without any search--this function MUST
         #          call self.queue.put(ACTION) at least once before time expires
         #          (the timer is automatically managed for you)
-        import random
         self.queue.put(random.choice(state.actions()))
+        search_state = _FastState(state)
+        if 0 in search_state.liberty_counts():
+            # the game is already over, nothing to search
+            return
+        pv = self.previous_pv(state)
+        value = None
         max_depth = 2
-        best_move = None
-        # best_score = -2**30
 
         # for this value of max_depth
         while True:
-            # call minimax function for this depth limit
-            best_move = self.minimax(state, max_depth)
-            # put in the action queue
-            self.queue.put(best_move)
-            # print(best_move)
+            # search this depth limit; improving root moves are put in the
+            # action queue as soon as they are found
+            value, pv = self.aspiration_search(search_state, max_depth, value, pv)
+            # hand the principal variation to the next iteration & next turn
+            self.context = {"ply_count": state.ply_count, "pv": pv}
+            self.queue.put(search_state.to_action(pv[0]))
             # increment max_depth parameter and continue
-            # print(f"Finished searching through depth {max_depth}")
             max_depth += 1
 
-    def minimax(self, state, max_depth):
-        best_val, best_move = self.get_max(state, float("-inf"), float("inf"), max_depth)
-        return best_move
-
-    def score_state(self, state, player_id):
-        the_other_player = 1 - player_id
-        num_my_moves = state.liberties(state.locs[player_id])
-        num_opponent_moves = state.liberties(state.locs[the_other_player])
-        return len(num_my_moves) - len(num_opponent_moves)
-
-    def get_max(self, state, alpha, beta, remaining_depth):
-        # if this is terminal state, then return the utility
-        if state.terminal_test():
-            util = state.utility(player_id=self.player_id)
-            if util > 0:
-                # our player wins
-                import random
-                return util, random.choice(state.actions())
+    def previous_pv(self, state):
+        """ Return the rest of the principal variation found on our last turn
+        if both players have followed it since, otherwise an empty list
+        """
+        context = self.context
+        if not context or state.ply_count != context["ply_count"] + 2:
+            return []
+        pv = context["pv"]
+        if len(pv) < 2 or (state.locs[self.player_id], state.locs[1 - self.player_id]) != (pv[0], pv[1]):
+            return []
+        return pv[2:]
+
+    def aspiration_search(self, state, depth, previous_value, pv):
+        """ Search the root to `depth` plies inside a narrow window around the
+        previous iteration's value, widening to a full search if the result
+        falls outside of it
+
+        Returns
+        -------
+        (value, pv)
+            The value of the root and the new principal variation
+        """
+        alpha, beta = float("-inf"), float("inf")
+        if previous_value is not None and abs(previous_value) != float("inf"):
+            alpha, beta = previous_value - ASPIRATION_WINDOW, previous_value + ASPIRATION_WINDOW
+        value, best_move = self.search_root(state, depth, alpha, beta, pv)
+        if value <= alpha or value >= beta:
+            value, best_move = self.search_root(state, depth, float("-inf"), float("inf"), pv)
+        return value, [best_move] + self.principal_variation(state, best_move, depth - 1)
+
+    def search_root(self, state, depth, alpha, beta, pv):
+        """ Run negamax on every root move, calling self.queue.put() each time
+        the best move so far improves on the bottom of the window, so a search
+        cut off by the timer still hands back its best finding
+        """
+        window_alpha = alpha
+        best_value, best_move = None, None
+        for action in self.ordered_actions(state, self.lookup(state), pv[0] if pv else None):
+            state.do_move(action)
+            value, _ = self.negamax(state, depth - 1, -beta, -alpha, pv[1:] if pv and action == pv[0] else ())
+            state.undo_move()
+            value = -value
+            if best_value is None or value > best_value:
+                best_value, best_move = value, action
+                if value > window_alpha:
+                    self.queue.put(state.to_action(action))
+            if best_value > alpha:
+                alpha = best_value
+            if alpha >= beta:
+                break
+        self.store(state, window_alpha, beta, depth, best_value, best_move)
+        return best_value, best_move
+
+    def principal_variation(self, state, first_move, max_length):
+        """ Follow the stored best moves from the state after `first_move` """
+        state.do_move(first_move)
+        pv = []
+        while len(pv) < max_length:
+            entry = self.lookup(state)
+            if entry is None or entry.best_move not in state.actions():
+                break
+            pv.append(entry.best_move)
+            state.do_move(entry.best_move)
+        for _ in range(len(pv) + 1):
+            state.undo_move()
+        return pv
+
+    def probe(self, entry, alpha, beta, remaining_depth):
+        """ Use a previous search result for this state to tighten the
+        alpha-beta window
+
+        Returns
+        -------
+        (bool, alpha, beta)
+            True if the stored value alone settles this node, followed by
+            the (possibly) narrowed bounds
+        """
+        if entry is None:
+            return False, alpha, beta
+        if entry.flag == TERMINAL:
+            return True, alpha, beta
+        if entry.depth < remaining_depth:
+            return False, alpha, beta
+        if entry.flag == EXACT:
+            return True, alpha, beta
+        if entry.flag == LOWER:
+            alpha = max(alpha, entry.value)
+        else:
+            beta = min(beta, entry.value)
+        return alpha >= beta, alpha, beta
+
+    def ordered_actions(self, state, entry, pv_move=None):
+        """ Return the legal actions sorted so that alpha-beta cuts off early:
+        the best move found by an earlier search of this state comes first,
+        then the principal variation move of the previous iteration, then the
+        killer moves of this ply, then the rest by descending mobility of the
+        player making the move, with ties broken by history score
+        """
+        # generate and score the moves in a single pass over the bitboard
+        history = self.history
+        board = state.board
+        open_cells = board & KNIGHT_MASK[state.locs[state.ply_count % 2]]
+        scored = []
+        while open_cells:
+            lowest_bit = open_cells & -open_cells
+            open_cells ^= lowest_bit
+            cell = lowest_bit.bit_length() - 1
+            scored.append((popcount(board & KNIGHT_MASK[cell]), history[cell], cell))
+        scored.sort(reverse=True)
+        actions = [cell for _, _, cell in scored]
+        second_killer, first_killer = reversed(self.killers[state.ply_count])
+        for move in (second_killer, first_killer, pv_move, None if entry is None else entry.best_move):
+            if move is not None and move in actions:
+                actions.remove(move)
+                actions.insert(0, move)
+        return actions
+
+    def lookup(self, state):
+        """ Return the stored search result for `state` or for its mirror
+        image, with the best move reflected to match `state` if needed
+        """
+        mirror_key = state.mirror_key
+        if mirror_key is not None and mirror_key < state.key:
+            entry = self.tt.get(mirror_key)
+            if entry is not None and entry.best_move is not None:
+                entry = entry._replace(best_move=MIRROR[entry.best_move])
+            return entry
+        return self.tt.get(state.key)
+
+    def store(self, state, alpha, beta, remaining_depth, value, best_move, flag=None):
+        """ Record a search result along with which bound it represents
+
+        A state and its mirror image share one entry under the smaller of
+        their two keys, with the best move oriented for the state that owns
+        that key. Returns the stored entry.
+        """
+        key, mirror_key = state.key, state.mirror_key
+        if mirror_key is not None and mirror_key < key:
+            key = mirror_key
+            if best_move is not None:
+                best_move = MIRROR[best_move]
+        if flag is None:
+            if value <= alpha:
+                flag = UPPER
+            elif value >= beta:
+                flag = LOWER
+            else:
+                flag = EXACT
+        entry = TTEntry(key, remaining_depth, value, flag, best_move)
+        self.tt.put(entry)
+        return entry
+
+    def negamax(self, state, depth, alpha, beta, pv=()):
+        """ Depth-limited alpha-beta search in negamax form
+
+        Values are always scored for the player to move, so a child's value
+        is negated on its way up to the parent. Instead of recursing, the
+        tree is walked with an explicit stack holding one frame per open node:
+        [moves, next_index, alpha, beta, window_alpha, depth, best_value, best_move]
+
+        `pv` is the expected line of play from `state`; while the search
+        follows it, each node tries the next pv move early.
+
+        Returns
+        -------
+        (value, move)
+            The value of `state` for the player to move and the best move
+            (a destination cell), or None if `state` was not expanded
+        """
+        # bind everything called once per node to a local name: in CPython
+        # every attribute lookup is a dictionary probe, and this loop runs
+        # them on each node it visits
+        lookup, probe, store = self.lookup, self.probe, self.store
+        killers, history = self.killers, self.history
+        ordered_actions = self.ordered_actions
+        liberty_counts, do_move, undo_move = state.liberty_counts, state.do_move, state.undo_move
+        stack = []
+        push, pop = stack.append, stack.pop
+        best_move = None
+        pv_length = 0  # number of plies on the current path that follow pv
+        while True:
+            # settle the value of the node we just arrived at, or open a frame
+            if depth == 0:
+                # one pair of popcounts gives both the game-over test and the
+                # heuristic score: own mobility minus opponent mobility
+                own_free, opp_free = liberty_counts()
+                if own_free and opp_free:
+                    value = own_free - opp_free
+                else:
+                    value = float("inf") if own_free else float("-inf")
             else:
-                return util, None
-
-        # if no more depth allowed, then compute the score and return
-        if remaining_depth == 0:
-            return self.score_state(state=state, player_id=self.player_id), None
-        current_max_value = None
-        current_max_move = None
-        # loop through possible next actions
-        for action in state.actions():
-            next_state = state.result(action)
-            min_value, _ = self.get_min(next_state, alpha, beta, remaining_depth - 1)
-            # get the max move so far
-            if current_max_value is None or min_value > current_max_value:
-                current_max_value = min_value
-                current_max_move = action
-            # update alpha/beta
-            if current_max_value > alpha:
-                alpha = current_max_value
-            # exit early if necessary (AB pruning)
-            if current_max_value >= beta:
-                return current_max_value, current_max_move
-        return current_max_value, current_max_move
-
-    def get_min(self, state, alpha, beta, remaining_depth):
-        # the_other_player = 1 - self.player_id
-        if state.terminal_test():
-            return state.utility(player_id=self.player_id), None
-        if remaining_depth == 0:
-            return self.score_state(state=state, player_id=self.player_id), None
-        current_min_value = None
-        current_min_move = None
-        # loop through possible next actions:
-        for action in state.actions():
-            next_state = state.result(action)
-            max_value, _ = self.get_max(next_state, alpha, beta, remaining_depth - 1)
-            if current_min_value is None or max_value < current_min_value:
-                current_min_value = max_value
-                current_min_move = action
-            if current_min_value < beta:
-                beta = current_min_value
-            if current_min_value <= alpha:
-                return current_min_value, current_min_move
-        return current_min_value, current_min_move
+                entry = lookup(state)
+                if entry is None:
+                    # first visit: test for game over once and remember the answer;
+                    # any stored entry for a state that was expanded means it's live
+                    own_free, opp_free = liberty_counts()
+                    if not (own_free and opp_free):
+                        value = float("inf") if own_free else float("-inf")
+                        entry = store(state, alpha, beta, 0, value, None, TERMINAL)
+                cutoff, alpha, beta = probe(entry, alpha, beta, depth)
+                if cutoff:
+                    value, best_move = entry.value, entry.best_move
+                elif depth == 1:
+                    player_id = state.ply_count % 2
+                    value, best_move = horizon_search(state.board, state.locs[player_id],
+                                                      state.locs[1 - player_id], alpha, beta)
+                    store(state, alpha, beta, depth, value, best_move)
+                else:
+                    value = None
+                    level = len(stack)
+                    pv_move = pv[level] if pv_length == level < len(pv) else None
+                    push([ordered_actions(state, entry, pv_move), 0, alpha, beta, alpha, depth, None, None])
+
+            # hand finished values up the stack until a frame has children left
+            while value is not None:
+                if not stack:
+                    return value, best_move
+                undo_move()
+                pv_length = min(pv_length, len(stack) - 1)
+                value = -value
+                frame = stack[-1]
+                moves, index, alpha, beta, window_alpha, depth, best_value, best_move = frame
+                if best_value is None or value > best_value:
+                    best_value = frame[6] = value
+                    best_move = frame[7] = moves[index - 1]
+                if best_value > alpha:
+                    alpha = frame[2] = best_value
+                if alpha >= beta or index == len(moves):
+                    pop()
+                    if alpha >= beta:
+                        # remember the refutation for the sibling nodes of this ply
+                        ply_killers = killers[state.ply_count]
+                        if ply_killers[0] != best_move:
+                            ply_killers[1], ply_killers[0] = ply_killers[0], best_move
+                        history[best_move] += 1 << depth
+                    store(state, window_alpha, beta, depth, best_value, best_move)
+                    value = best_value
+                else:
+                    value = None
 
+            # step into the next child of the frame on top of the stack
+            frame = stack[-1]
+            moves, index, alpha, beta = frame[0], frame[1], frame[2], frame[3]
+            frame[1] = index + 1
+            if pv_length == len(stack) - 1 < len(pv) and moves[index] == pv[pv_length]:
+                pv_length += 1
+            do_move(moves[index])
+            alpha, beta, depth = -beta, -alpha, frame[5] - 1
@@ -2,12 +2,38 @@
 import unittest
 
 from collections import deque
-from random import choice
+from queue import Queue
+from random import Random, choice
 from textwrap import dedent
 
 from isolation import Isolation, Agent, fork_get_action, play, DebugState
+from isolation.isolation import Action
 from sample_players import RandomPlayer
-from my_custom_player import CustomPlayer
+from my_custom_player import (CustomPlayer, TranspositionTable, _FastState, zobrist_hash,
+                              MIRROR, EXACT, LOWER, UPPER)
+
+
+def random_state(rng, min_plies=2, max_plies=30):
+    """ Play random moves from an empty board, stopping early if the game ends """
+    state = Isolation()
+    for _ in range(rng.randrange(min_plies, max_plies)):
+        if state.terminal_test():
+            break
+        state = state.result(rng.choice(state.actions()))
+    return state
+
+
+def minimax(state, depth):
+    """ Brute-force negamax value of `state` for the player to move: the
+    game's own utility once it is over, otherwise own minus opponent
+    mobility at the depth limit
+    """
+    if state.terminal_test():
+        return state.utility(state.player())
+    if depth == 0:
+        return (len(state.liberties(state.locs[state.player()]))
+                - len(state.liberties(state.locs[1 - state.player()])))
+    return max(-minimax(state.result(action), depth - 1) for action in state.actions())
 
 
 class BaseCustomPlayerTest(unittest.TestCase):
@@ -67,3 +93,126 @@ class CustomPlayerPlayTest(BaseCustomPlayerTest):
                        
             raise Exception("Your agent did not play until a terminal state.")
 
+
+
+class CustomPlayerSearchTest(unittest.TestCase):
+    def setUp(self):
+        self.rng = Random(0x15014710)
+
+    def test_aspiration_search_matches_minimax(self):
+        """ aspiration_search() returns the minimax value and a move that achieves it """
+        checked = 0
+        while checked < 60:
+            state = random_state(self.rng)
+            search_state = _FastState(state)
+            if 0 in search_state.liberty_counts():
+                continue
+            agent = CustomPlayer(state.player())
+            agent.queue = Queue()
+            value, pv = None, []
+            for depth in (1, 2, 3):
+                value, pv = agent.aspiration_search(search_state, depth, value, pv)
+                self.assertEqual(value, minimax(state, depth), "depth {} from state {}".format(depth, state))
+                best = state.result(search_state.to_action(pv[0]))
+                self.assertEqual(value, -minimax(best, depth - 1))
+            checked += 1
+
+    def test_lone_cell_zero_liberty(self):
+        """ a player whose only open liberty is cell 0 is stuck, as in Isolation.terminal_test() """
+        # player 2 to move; player 1's only move is to cell 27, where cell 0 is its only liberty
+        win = Isolation(board=41380481162877395520426754833384833, ply_count=59, locs=(52, 71))
+        # the same game one ply later, with player 1 to make that move
+        loss = Isolation(board=41380481158041692241968238134560129, ply_count=60, locs=(52, 82))
+        for state, depth, value in ((win, 2, float("inf")), (loss, 1, float("-inf"))):
+            agent = CustomPlayer(state.player())
+            agent.queue = Queue()
+            self.assertEqual(minimax(state, depth), value)
+            self.assertEqual(agent.aspiration_search(_FastState(state), depth, None, [])[0], value)
+
+
+class FastStateTest(unittest.TestCase):
+    def test_do_undo_move(self):
+        """ do_move() tracks Isolation.result(), and undo_move() restores every field """
+        rng = Random(0x15014710)
+        for _ in range(20):
+            state = Isolation()
+            search_state = _FastState(state)
+            snapshots = []
+            while 0 not in search_state.liberty_counts():
+                snapshots.append((search_state.board, list(search_state.locs),
+                                  search_state.ply_count, search_state.key))
+                cell = rng.choice(search_state.actions())
+                state = state.result(search_state.to_action(cell))
+                search_state.do_move(cell)
+                self.assertEqual(search_state.board, state.board)
+                self.assertEqual(search_state.locs, [-1 if loc is None else loc for loc in state.locs])
+                self.assertEqual(search_state.ply_count, state.ply_count)
+                self.assertEqual(search_state.key, zobrist_hash(state))
+            while snapshots:
+                search_state.undo_move()
+                self.assertEqual((search_state.board, search_state.locs,
+                                  search_state.ply_count, search_state.key), snapshots.pop())
+
+    def test_mirror_key(self):
+        """ from a symmetric root, mirror_key is the key of the mirror-image position """
+        rng = Random(0x15014710)
+        self.assertIsNone(_FastState(Isolation().result(0)).mirror_key)
+        for _ in range(20):
+            search_state, mirror_state = _FastState(Isolation()), _FastState(Isolation())
+            while 0 not in search_state.liberty_counts():
+                cell = rng.choice(search_state.actions())
+                search_state.do_move(cell)
+                mirror_state.do_move(MIRROR[cell])
+                self.assertEqual(search_state.mirror_key, mirror_state.key)
+                self.assertEqual(mirror_state.mirror_key, search_state.key)
+
+
+class TranspositionTableTest(unittest.TestCase):
+    def setUp(self):
+        self.agent = CustomPlayer(0)
+        self.state = _FastState(random_state(Random(0x15014710), min_plies=4, max_plies=5))
+        self.move = self.state.actions()[0]
+
+    def test_round_trip(self):
+        """ a stored entry comes back under the same key and no other """
+        self.agent.store(self.state, -1, 1, 3, 0, self.move)
+        entry = self.agent.lookup(self.state)
+        self.assertEqual((entry.key, entry.depth, entry.value, entry.flag, entry.best_move),
+                         (self.state.key, 3, 0, EXACT, self.move))
+        self.assertIsNone(self.agent.tt.get(self.state.key + len(self.agent.tt.deep)))
+        self.assertIsNone(TranspositionTable().get(self.state.key))
+
+    def test_exact_bound(self):
+        """ an exact value settles the node only if it was searched deep enough """
+        entry = self.agent.store(self.state, -1, 1, 3, 0, self.move)
+        self.assertEqual(entry.flag, EXACT)
+        self.assertTrue(self.agent.probe(entry, -1, 1, 3)[0])
+        self.assertEqual(self.agent.probe(entry, -1, 1, 4), (False, -1, 1))
+
+    def test_lower_bound(self):
+        """ a value at or above beta raises alpha, and cuts off if alpha reaches beta """
+        entry = self.agent.store(self.state, -1, 1, 3, 2, self.move)
+        self.assertEqual(entry.flag, LOWER)
+        self.assertEqual(self.agent.probe(entry, -5, 5, 3), (False, 2, 5))
+        self.assertEqual(self.agent.probe(entry, -5, 2, 3), (True, 2, 2))
+
+    def test_upper_bound(self):
+        """ a value at or below alpha lowers beta, and cuts off if beta reaches alpha """
+        entry = self.agent.store(self.state, -1, 1, 3, -2, self.move)
+        self.assertEqual(entry.flag, UPPER)
+        self.assertEqual(self.agent.probe(entry, -5, 5, 3), (False, -5, -2))
+        self.assertEqual(self.agent.probe(entry, -2, 5, 3), (True, -2, -2))
+
+    def test_mirror_lookup(self):
+        """ mirror-image positions share one entry, with the best move reflected """
+        search_state, mirror_state = _FastState(Isolation()), _FastState(Isolation())
+        for cell in (3, 60, 3 + Action.NNE):
+            search_state.do_move(cell)
+            mirror_state.do_move(MIRROR[cell])
+        self.assertNotEqual(search_state.key, mirror_state.key)
+        move = search_state.actions()[0]
+        self.assertNotEqual(move, MIRROR[move])
+        self.agent.store(search_state, -1, 1, 3, 0, move)
+        self.assertEqual(self.agent.lookup(search_state).best_move, move)
+        self.assertEqual(self.agent.lookup(mirror_state).best_move, MIRROR[move])
+        self.assertEqual(self.agent.lookup(mirror_state).value, 0)
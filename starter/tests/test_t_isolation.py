@@ -0,0 +1,42 @@
+
+import unittest
+
+from random import Random
+
+from isolation import isolation
+from isolation import t_isolation
+
+
+class TIsolationTest(unittest.TestCase):
+    """ isolation/t_isolation.py is a rewrite of the game engine, so every
+    ply of a game played in both must look the same in both
+    """
+    def _locs(self, state):
+        return tuple(-1 if loc is None else loc for loc in state.locs)
+
+    def test_matches_engine(self):
+        """ actions(), liberties(), DebugState and utility() agree with the engine """
+        rng = Random(0x15014710)
+        for _ in range(100):
+            state, t_state = isolation.Isolation(), t_isolation.Isolation()
+            while True:
+                self.assertEqual(self._locs(state), t_state.locs)
+                self.assertEqual(str(isolation.DebugState.from_state(state)),
+                                 str(t_isolation.DebugState.from_state(t_state)))
+                self.assertEqual(list(state.actions()), list(t_state.actions()))
+                liberties = [state.liberties(loc) for loc in state.locs]
+                self.assertEqual(liberties, [t_state.liberties(loc) for loc in t_state.locs])
+                if [0] in liberties:
+                    # the engine tests any(liberties), which misses a lone liberty
+                    # at cell 0; t_isolation tests the liberty mask and counts it
+                    self.assertTrue(state.terminal_test())
+                    for player_id in (0, 1):
+                        self.assertEqual(t_state._has_liberties(player_id), bool(liberties[player_id]))
+                    break
+                for player_id in (0, 1):
+                    self.assertEqual(state.utility(player_id), t_state.utility(player_id))
+                if state.terminal_test():
+                    self.assertTrue(t_state.terminal_test())
+                    break
+                action = rng.choice(state.actions())
+                state, t_state = state.result(action), t_state.result(action)
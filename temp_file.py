@@ -13,13 +13,15 @@ def named_tuple_factory(type_name, *fields):
                     f" got {len(args)}"
                 )
             # cls.__name__ = type_name
-            for index, field in enumerate(fields):
-                setattr(cls, field, property(itemgetter(index)))
             return super().__new__(cls, args)
 
         def __repr__(self):
             return f"""{type_name}({", ".join(repr(arg) for arg in self)})"""
 
+    # attach the field accessors once, when the class is created
+    for index, field in enumerate(fields):
+        setattr(NamedTuple, field, property(itemgetter(index)))
+
     NamedTuple.__name__ = type_name
     return NamedTuple
 